@@ -0,0 +1,248 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+import grpc
+from grpc.experimental import session_cache
+
+import chat_pb2
+import chat_pb2_grpc
+import chat_server
+from chat_presence import PresenceTracker
+from chat_search import DEFAULT_PAGE_SIZE, MAX_CANDIDATES, MessageIndex
+
+def bench_presence(users=1000, ticks=4, keystrokes=2):
+    """1000 simulated typers: one broadcast per keystroke vs. one coalesced delta per tick"""
+    clients = [chat_server.Client() for _ in range(users)]
+    names = [f"user{i}" for i in range(users)]
+
+    # Naive: every keystroke is pushed to every client -> O(users^2) per round
+    start = time.perf_counter()
+    pushed = 0
+    for _ in range(ticks):
+        for name in names:
+            for _ in range(keystrokes):
+                msg = chat_pb2.ChatMessage(presence=chat_pb2.PresenceUpdate(entries=[
+                    chat_pb2.PresenceEntry(username=name, online=True, typing=True)
+                ])).SerializeToString()
+                for c in clients:
+                    c.push(msg)
+                    pushed += 1
+        for c in clients:
+            c.messages.clear()
+    naive = time.perf_counter() - start
+    print(f"naive:     {naive / ticks * 1000:10.1f}ms/tick  {pushed // ticks} messages/tick")
+
+    # Coalesced: keystrokes only touch the tracker, one delta per tick goes to each client
+    tracker = PresenceTracker()
+    for name in names:
+        tracker.join(name)
+    tracker.drain()
+    start = time.perf_counter()
+    pushed = 0
+    for tick in range(ticks):
+        typing = tick % 2 == 0
+        for name in names:
+            for _ in range(keystrokes):
+                tracker.set_typing(name, typing)
+        entries = tracker.drain()
+        if entries:
+            msg = chat_pb2.ChatMessage(presence=chat_pb2.PresenceUpdate(entries=entries)).SerializeToString()
+            for c in clients:
+                c.push(msg)
+                pushed += 1
+        for c in clients:
+            c.messages.clear()
+    coalesced = time.perf_counter() - start
+    print(f"coalesced: {coalesced / ticks * 1000:10.1f}ms/tick  {pushed // ticks} messages/tick")
+
+    # Idle tick in a big room: nothing changed, nothing is sent
+    start = time.perf_counter()
+    for _ in range(1000):
+        tracker.drain()
+    print(f"idle:      {(time.perf_counter() - start):10.4f}ms/tick")
+
+def bench_search(messages=1_000_000, queries=200):
+    """Query latency over a large history, and what indexing costs the broadcast path"""
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(20000)]
+    rooms = [f"room{i}" for i in range(10)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = MessageIndex(os.path.join(tmp, "history.db"), batch_size=5000)
+        start = time.perf_counter()
+        enqueue = 0.0
+        for i in range(messages):
+            msg = chat_pb2.ChatMessage(
+                username=f"user{i % 500}", room=rooms[i % len(rooms)],
+                message=" ".join(rng.choices(vocabulary, k=12) + (["hello"] if i % 3 == 0 else [])),
+            )
+            t = time.perf_counter()
+            index.add(msg, timestamp=1_700_000_000 + i)
+            enqueue += time.perf_counter() - t
+        index.flush()
+        print(f"indexed {messages} messages in {time.perf_counter() - start:.1f}s, "
+              f"add() {enqueue / messages * 1e6:.2f}us/message on the broadcast path")
+
+        cases = {
+            "one term": lambda: rng.choice(vocabulary),
+            "two terms": lambda: " ".join(rng.sample(vocabulary, 2)),
+            "term + room": lambda: rng.choice(vocabulary),
+            # In a third of all messages, so it has far more matches than can be ranked
+            "common word": lambda: "hello",
+            "common, p5": lambda: "hello",
+            # 100 messages at the very start of the history, behind every newer match
+            "common, old": lambda: "hello",
+            "common, past": lambda: "hello",
+        }
+        # First page of the second window, past the MAX_CANDIDATES newest matches
+        past_token = ""
+        for _ in range(MAX_CANDIDATES // DEFAULT_PAGE_SIZE):
+            past_token = index.search("hello", page_token=past_token)[1]
+
+        for name, make_query in cases.items():
+            timings = []
+            for _ in range(queries):
+                room = rng.choice(rooms) if name == "term + room" else ""
+                since, until = (1_700_001_000, 1_700_001_100) if name == "common, old" else (0.0, 0.0)
+                page_token = ""
+                if name == "common, p5":
+                    for _ in range(4):
+                        page_token = index.search(make_query(), page_token=page_token)[1]
+                if name == "common, past":
+                    page_token = past_token
+                t = time.perf_counter()
+                index.search(make_query(), room=room, since=since, until=until, page_token=page_token)
+                timings.append(time.perf_counter() - t)
+            timings.sort()
+            print(f"{name:12} p50 {timings[len(timings) // 2] * 1000:7.2f}ms  "
+                  f"p99 {timings[int(len(timings) * 0.99)] * 1000:7.2f}ms")
+
+def bench_fanout(recipients=50, sizes_mb=(1, 10, 100)):
+    """Per-recipient re-serialization (old handler) vs. relaying the received bytes"""
+    for size_mb in sizes_mb:
+        data = chat_pb2.ChatMessage(
+            username="alice", message="clip.mp4", media_type="video/mp4",
+            media_data=os.urandom(size_mb * 1024 * 1024),
+        ).SerializeToString()
+
+        # Old path: parse once, then the response serializer encodes it again for every recipient
+        start = time.perf_counter()
+        msg = chat_pb2.ChatMessage.FromString(data)
+        for _ in range(recipients):
+            msg.SerializeToString()
+        per_recipient = time.perf_counter() - start
+
+        # Raw-bytes handler: parse once for routing, every recipient shares the received buffer
+        clients = [chat_server.Client() for _ in range(recipients)]
+        start = time.perf_counter()
+        chat_pb2.ChatMessage.FromString(data)
+        for c in clients:
+            c.push(data)
+        shared = time.perf_counter() - start
+
+        print(f"{size_mb:4d} MB x {recipients}: re-serialize {per_recipient * 1000:9.1f}ms  "
+              f"shared bytes {shared * 1000:7.1f}ms  ({per_recipient / shared:.0f}x)")
+
+def bench_tls(rounds=50):
+    """Connect and reconnect latency: insecure vs. TLS + token auth, cold vs. token reuse vs. TLS resumption"""
+    invite_key = "bench"
+    with tempfile.TemporaryDirectory() as tmp:
+        index = MessageIndex(os.path.join(tmp, "history.db"))
+        insecure, insecure_port = chat_server.create_server("127.0.0.1:0", index)
+        secure, secure_port = chat_server.create_server(
+            "127.0.0.1:0", index, certs_dir=os.path.join(tmp, "certs"), invite_key=invite_key
+        )
+        insecure.start()
+        secure.start()
+        with open(os.path.join(tmp, "certs", "server.crt"), "rb") as f:
+            root_cert = f.read()
+        search = chat_pb2.SearchRequest(query="hello")
+
+        def insecure_connect():
+            with grpc.insecure_channel(f"localhost:{insecure_port}") as channel:
+                chat_pb2_grpc.ChatServiceStub(channel).Search(search)
+
+        def tls_connect(options=(), token=None, username="bench"):
+            credentials = grpc.ssl_channel_credentials(root_certificates=root_cert)
+            with grpc.secure_channel(f"localhost:{secure_port}", credentials, options=options) as channel:
+                stub = chat_pb2_grpc.ChatServiceStub(channel)
+                if token is None:
+                    token = stub.Login(chat_pb2.LoginRequest(username=username, invite_key=invite_key)).token
+                stub.Search(search, metadata=[("authorization", f"Bearer {token}")])
+                return token
+
+        # What the client keeps between connections: its TLS session cache and its token
+        cache = session_cache.ssl_session_cache_lru(8)
+        resume_options = [("grpc.ssl_session_cache", cache)]
+        token = tls_connect(resume_options)
+
+        cases = {
+            "insecure connect": insecure_connect,
+            # Logging in revokes older tokens, so this case uses its own name
+            "tls cold connect + login": lambda: tls_connect(username="bench-cold"),
+            "tls reconnect, token only": lambda: tls_connect((), token),
+            # TLS 1.3 resumption keeps the key exchange and the round trips and only skips
+            # verifying the certificate, so on loopback it saves a fraction of a millisecond
+            "tls reconnect, token + tls": lambda: tls_connect(resume_options, token),
+        }
+        for name, connect in cases.items():
+            timings = []
+            for _ in range(rounds):
+                t = time.perf_counter()
+                connect()
+                timings.append(time.perf_counter() - t)
+            print(f"{name:26} median {statistics.median(timings) * 1000:7.2f}ms  "
+                  f"max {max(timings) * 1000:7.2f}ms")
+
+        # Calls on an established connection; like the real client, an open chat stream
+        # keeps the session cached so they skip verifying the token
+        credentials = grpc.ssl_channel_credentials(root_certificates=root_cert)
+        with grpc.secure_channel(f"localhost:{secure_port}", credentials) as channel, \
+                grpc.insecure_channel(f"localhost:{insecure_port}") as plain:
+            done = threading.Event()
+
+            def hello():
+                yield chat_pb2.ChatMessage(username="bench", presence=chat_pb2.PresenceUpdate())
+                done.wait()
+
+            chat = chat_pb2_grpc.ChatServiceStub(channel).Chat(hello(), metadata=[("authorization", f"Bearer {token}")])
+            next(chat)
+            for name, stub, metadata in [
+                ("insecure call", chat_pb2_grpc.ChatServiceStub(plain), None),
+                ("tls + auth call", chat_pb2_grpc.ChatServiceStub(channel), [("authorization", f"Bearer {token}")]),
+            ]:
+                stub.Search(search, metadata=metadata)
+                timings = []
+                for _ in range(rounds * 4):
+                    t = time.perf_counter()
+                    stub.Search(search, metadata=metadata)
+                    timings.append(time.perf_counter() - t)
+                print(f"{name:26} median {statistics.median(timings) * 1000:7.2f}ms")
+            done.set()
+            chat.cancel()
+
+        insecure.stop(0)
+        secure.stop(0)
+
+BENCHMARKS = {
+    "presence": bench_presence,
+    "search": bench_search,
+    "fanout": bench_fanout,
+    "tls": bench_tls,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Chat server micro-benchmarks")
+    parser.add_argument("benchmarks", nargs="*", help=f"any of: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
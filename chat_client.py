@@ -1,12 +1,13 @@
 # [1] ===== IMPORTS =====
 from argparse import Action
 import sys, os, io, time, platform, threading, grpc
+from grpc.experimental import session_cache
 from tkinter import Menu
 from datetime import datetime
 from PyQt6 import QtMultimedia 
 from PyQt6.QtWidgets import (
     QApplication, QMenu, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
-    QLineEdit, QFileDialog, QScrollArea, QMainWindow, QMessageBox
+    QLineEdit, QFileDialog, QScrollArea, QMainWindow, QMessageBox, QInputDialog, QProgressBar
 )
 from PyQt6.QtGui import QPixmap, QImage, QFont, QAction, QDesktopServices
 from PyQt6.QtCore import Qt, QCoreApplication, pyqtSignal, QObject, QUrl, QTimer 
@@ -14,6 +15,7 @@ from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PyQt6.QtMultimediaWidgets import QVideoWidget
 from PIL import Image, ImageDraw
 import chat_pb2, chat_pb2_grpc
+from chat_transfers import TransferManager
 
 try:
     import winsound
@@ -21,25 +23,60 @@ except ImportError:
     winsound = None
 
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+DEFAULT_PORT = 50051
+RECONNECT_ATTEMPTS = 5
+STREAM_START_TIMEOUT = 5  # Seconds to wait for the roster snapshot that opens every chat stream
+# Shared by every channel so a reconnect resumes the TLS session instead of a full handshake
+SSL_SESSION_CACHE = session_cache.ssl_session_cache_lru(64)
+TYPING_IDLE_MS = 2000  # Stop "typing" after this long without a keystroke
+TYPING_REFRESH = 3.0  # Re-send "typing" while still typing so the server doesn't expire it
+
+class StreamStartTimeout(grpc.RpcError):
+    """The server accepted the chat stream but never answered; handled like an unreachable server"""
+
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+    def details(self):
+        return f"Server did not answer within {STREAM_START_TIMEOUT}s"
+
+    def __str__(self):
+        return self.details()
 
 class SignalHandler(QObject):
     add_message_signal = pyqtSignal(str, bool, str, bytes, str, str)
     system_message_signal = pyqtSignal(str)
     update_group_picture_signal = pyqtSignal(bytes, str)  # New signal for group picture updates
+    presence_signal = pyqtSignal(object)  # chat_pb2.PresenceUpdate
+    transfer_progress_signal = pyqtSignal(str, int, int)  # transfer_id, sent, total
+    transfer_finished_signal = pyqtSignal(object, str)  # Transfer, error ("" on success)
 
 class ChatClient(QMainWindow):
     def __init__(self):
         super().__init__()
         self.channel = self.stub = self.username = self.server_ip = None
+        self.server_port = DEFAULT_PORT
+        self.invite_key = self.cert_path = self.token = None
         self.running = False
         self.messages_to_send = []
+        self.send_lock = threading.Lock()
+        self.stream = None  # {"active", "in_flight"} for the current chat stream
         self.profile_picture_data = None
         self.video_players = []
         self.image_windows = []  # Store image viewer windows
+        self.roster = {}  # username -> chat_pb2.PresenceEntry
+        self.is_typing = False
+        self.typing_sent_at = 0.0
+        self.transfers = None
+        self.transfer_rows = {}  # transfer_id -> (row widget, progress bar)
+        self.incoming = {}  # transfer_id -> (sender, list of received chunks); only used by the receive thread
         self.signal_handler = SignalHandler()
         self.signal_handler.add_message_signal.connect(self.create_message_bubble)
         self.signal_handler.system_message_signal.connect(self.create_system_message)
         self.signal_handler.update_group_picture_signal.connect(self.update_group_picture)  # Connect new signal
+        self.signal_handler.presence_signal.connect(self.update_presence)
+        self.signal_handler.transfer_progress_signal.connect(self.update_transfer_progress)
+        self.signal_handler.transfer_finished_signal.connect(self.finish_transfer)
         self.is_dark_mode = True
         self.show_login_screen()
 
@@ -72,31 +109,151 @@ class ChatClient(QMainWindow):
         self.server_input.setPlaceholderText("Server IP (e.g. localhost)")
         self.server_input.setStyleSheet("background-color: #374151; color: white; padding: 6px;")
         layout.addWidget(self.server_input)
+        self.invite_input = QLineEdit()
+        self.invite_input.setPlaceholderText("Invite key (optional)")
+        self.invite_input.setEchoMode(QLineEdit.EchoMode.Password)
+        self.invite_input.setStyleSheet("background-color: #374151; color: white; padding: 6px;")
+        layout.addWidget(self.invite_input)
+        cert_layout = QHBoxLayout()
+        self.cert_input = QLineEdit()
+        self.cert_input.setPlaceholderText("Server certificate for TLS (optional)")
+        self.cert_input.setStyleSheet("background-color: #374151; color: white; padding: 6px;")
+        cert_layout.addWidget(self.cert_input)
+        browse_btn = QPushButton("...")
+        browse_btn.setFixedWidth(30)
+        browse_btn.clicked.connect(lambda: self.cert_input.setText(
+            QFileDialog.getOpenFileName(self.login_window, "Select server certificate", "", "Certificates (*.crt *.pem)")[0]
+            or self.cert_input.text()
+        ))
+        cert_layout.addWidget(browse_btn)
+        layout.addLayout(cert_layout)
         connect_btn = QPushButton("Connect")
         connect_btn.setStyleSheet("background-color: #10b981; color: white; padding: 10px;")
         connect_btn.clicked.connect(self.connect_to_server)
         layout.addWidget(connect_btn)
         self.login_window.setLayout(layout)
-        self.login_window.setFixedSize(300, 200)
+        self.login_window.setFixedSize(300, 280)
         self.login_window.show()
 
     def connect_to_server(self):
         self.username = self.username_input.text().strip()
         self.server_ip = self.server_input.text().strip()
+        self.invite_key = self.invite_input.text().strip() or None
+        self.cert_path = self.cert_input.text().strip() or None
         if not self.username or not self.server_ip:
             return
+        if ":" in self.server_ip:
+            self.server_ip, port = self.server_ip.rsplit(":", 1)
+            self.server_port = int(port) if port.isdigit() else DEFAULT_PORT
         try:
-            options = [('grpc.max_send_message_length', MAX_FILE_SIZE), ('grpc.max_receive_message_length', MAX_FILE_SIZE)]
-            self.channel = grpc.insecure_channel(f"{self.server_ip}:50051", options=options)
-            grpc.channel_ready_future(self.channel).result(timeout=5)
-            self.stub = chat_pb2_grpc.ChatServiceStub(self.channel)
+            self.open_channel()
+            if self.invite_key:
+                self.login()
+            self.transfers = TransferManager(
+                self.username, self.prepare_media,
+                on_progress=lambda t, sent, total: self.signal_handler.transfer_progress_signal.emit(t.id, sent, total),
+                on_finished=lambda t, error: self.signal_handler.transfer_finished_signal.emit(t, error or ""),
+            )
             self.running = True
+            # Only open the chat window once the server has let us in
+            call, first = self.start_stream()
             self.login_window.close()
-            self.build_chat_window()
+            self.build_chat_window(call, first)
         except Exception as e:
+            self.running = False
+            if self.transfers:
+                self.transfers.shutdown()
             QMessageBox.critical(self, "Connection Failed", f"Failed to connect: {e}")
 
-    def build_chat_window(self):
+    def open_channel(self):
+        options = [('grpc.max_send_message_length', MAX_FILE_SIZE), ('grpc.max_receive_message_length', MAX_FILE_SIZE)]
+        target = f"{self.server_ip}:{self.server_port}"
+        if self.cert_path:
+            with open(self.cert_path, "rb") as f:
+                credentials = grpc.ssl_channel_credentials(root_certificates=f.read())
+            options.append(('grpc.ssl_session_cache', SSL_SESSION_CACHE))
+            self.channel = grpc.secure_channel(target, credentials, options=options)
+        else:
+            self.channel = grpc.insecure_channel(target, options=options)
+        grpc.channel_ready_future(self.channel).result(timeout=5)
+        self.stub = chat_pb2_grpc.ChatServiceStub(self.channel)
+
+    def login(self):
+        """Trade the invite key for a session token, kept for reconnects"""
+        response = self.stub.Login(chat_pb2.LoginRequest(username=self.username, invite_key=self.invite_key), timeout=5)
+        self.token = response.token
+
+    def auth_metadata(self):
+        return [("authorization", f"Bearer {self.token}")] if self.token else None
+
+    def start_stream(self):
+        """Open the chat stream and wait for the roster snapshot, which proves the server let us in"""
+        stream = {"active": True, "in_flight": None}
+        with self.send_lock:
+            self.stream = stream
+        call = self.stub.Chat(self.message_generator(stream), metadata=self.auth_metadata())
+        # This runs on the GUI thread or in the reconnect loop, so a silent server must not block forever
+        timed_out = threading.Event()
+        timer = threading.Timer(STREAM_START_TIMEOUT, lambda: [timed_out.set(), call.cancel()])
+        timer.start()
+        try:
+            return call, next(call)
+        except grpc.RpcError as e:
+            self.end_stream()
+            if timed_out.is_set():
+                raise StreamStartTimeout() from e
+            raise
+        finally:
+            timer.cancel()
+
+    def end_stream(self):
+        """Stop the current stream's generator and put back what it may have lost"""
+        with self.send_lock:
+            stream = self.stream
+            if stream is None or not stream["active"]:
+                return
+            stream["active"] = False
+            lost, stream["in_flight"] = stream["in_flight"], None
+            # File chunks are covered by restarting their transfer; anything else is resent as is
+            if lost is not None and not (isinstance(lost, chat_pb2.ChatMessage) and lost.transfer_id and not lost.cancelled):
+                self.messages_to_send.insert(0, lost)
+        self.transfers.restart()
+
+    def reconnect(self, error):
+        """Re-open a dropped connection, reusing the TLS session and token when possible.
+
+        Returns (call, first response) of the new stream, or None if we should give up.
+        """
+        if error.code() not in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.UNAUTHENTICATED):
+            return None
+        # Without an invite key there is no way to get a token the server would accept
+        if error.code() == grpc.StatusCode.UNAUTHENTICATED and not self.invite_key:
+            return None
+        # Only log in again if the server rejected the token (expired, revoked, or the server restarted)
+        need_login = error.code() == grpc.StatusCode.UNAUTHENTICATED
+        self.signal_handler.system_message_signal.emit("Connection lost, reconnecting...")
+        for attempt in range(RECONNECT_ATTEMPTS):
+            time.sleep(min(0.5 * 2 ** attempt, 5))
+            if not self.running:
+                return None
+            try:
+                self.channel.close()
+                self.open_channel()
+                if need_login:
+                    self.login()
+                call, first = self.start_stream()
+                self.signal_handler.system_message_signal.emit("Reconnected.")
+                return call, first
+            except grpc.FutureTimeoutError:
+                continue
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.UNAUTHENTICATED and self.invite_key and not need_login:
+                    need_login = True
+                elif e.code() != grpc.StatusCode.UNAVAILABLE:
+                    return None
+        return None
+
+    def build_chat_window(self, call, first):
         self.setWindowTitle(f"Chat - {self.username}")
         self.resize(500, 600)
         central_widget = QWidget()
@@ -113,8 +270,17 @@ class ChatClient(QMainWindow):
         title = QLabel("Group Chat")
         title.setFont(QFont("Arial", 12, QFont.Weight.Bold))
         header.addWidget(title)
+
+        self.online_label = QLabel()
+        self.online_label.setStyleSheet("color: #9ca3af; font-size: 10px;")
+        header.addWidget(self.online_label)
         header.addStretch()
 
+        search_btn = QPushButton("🔍")
+        search_btn.setFixedSize(30, 30)
+        search_btn.clicked.connect(self.search_history)
+        header.addWidget(search_btn)
+
         theme_btn = QPushButton("☀" if not self.is_dark_mode else "🌙")
         theme_btn.setFixedSize(30, 30)
         theme_btn.clicked.connect(lambda: [self.toggle_theme(), theme_btn.setText("☀" if not self.is_dark_mode else "🌙")])
@@ -130,6 +296,13 @@ class ChatClient(QMainWindow):
         self.scroll_area.setWidget(self.scroll_content)
         layout.addWidget(self.scroll_area)
 
+        self.transfer_layout = QVBoxLayout()
+        layout.addLayout(self.transfer_layout)
+
+        self.typing_label = QLabel()
+        self.typing_label.setStyleSheet("color: #9ca3af; font-size: 10px; font-style: italic;")
+        layout.addWidget(self.typing_label)
+
         input_layout = QHBoxLayout()
         attach_btn = QPushButton("📎")
         attach_btn.clicked.connect(self.select_media)
@@ -137,6 +310,10 @@ class ChatClient(QMainWindow):
 
         self.entry = QLineEdit()
         self.entry.returnPressed.connect(self.send_message)
+        self.entry.textEdited.connect(self.on_text_edited)
+        self.typing_timer = QTimer(self)
+        self.typing_timer.setSingleShot(True)
+        self.typing_timer.timeout.connect(lambda: self.set_typing(False))
         input_layout.addWidget(self.entry)
 
         emoji_btn = QPushButton("😊")
@@ -150,7 +327,7 @@ class ChatClient(QMainWindow):
         layout.addLayout(input_layout)
         self.apply_theme()
         self.show()
-        threading.Thread(target=self.receive_messages, daemon=True).start()
+        threading.Thread(target=self.receive_messages, args=(call, first), daemon=True).start()
 
     def show_emoji_menu(self):
         menu = QMenu()
@@ -243,100 +420,283 @@ class ChatClient(QMainWindow):
             with open(filepath, "rb") as f:
                 return f.read()
 
+    def prepare_media(self, filepath):
+        """Read and process a file for sending; runs on the transfer manager's thread pool"""
+        filename = os.path.basename(filepath)
+        ext = filename.split('.')[-1].lower()
+
+        # Determine media type
+        if ext in ["png", "jpg", "jpeg", "gif", "bmp", "tiff"]:
+            media_type = f"image/{ext}"
+            # Process image for HD quality
+            media_data = self.process_hd_image(filepath)
+        elif ext in ["mp4", "avi", "mov", "mkv", "webm"]:
+            media_type = f"video/{ext}"
+            # Keep video files as-is
+            with open(filepath, "rb") as f:
+                media_data = f.read()
+        else:
+            media_type = f"application/{ext}"
+            # Keep other files as-is
+            with open(filepath, "rb") as f:
+                media_data = f.read()
+
+        # Check processed file size
+        if len(media_data) > MAX_FILE_SIZE:
+            raise ValueError("The processed file still exceeds 100 MB limit.")
+        return media_data, media_type
+
     def select_media(self):
-        filepath, _ = QFileDialog.getOpenFileName(self, "Select file", "", "All Files (*)")
-        if not filepath:
-            return
-        file_size = os.path.getsize(filepath)
-        if file_size > MAX_FILE_SIZE:
-            QMessageBox.warning(self, "File Too Large", "The selected file exceeds 100 MB limit.")
-            return
-        try:
-            filename = os.path.basename(filepath)
-            ext = filename.split('.')[-1].lower()
-            
-            # Determine media type
-            if ext in ["png", "jpg", "jpeg", "gif", "bmp", "tiff"]:
-                media_type = f"image/{ext}"
-                # Process image for HD quality
-                media_data = self.process_hd_image(filepath)
-            elif ext in ["mp4", "avi", "mov", "mkv", "webm"]:
-                media_type = f"video/{ext}"
-                # Keep video files as-is
-                with open(filepath, "rb") as f:
-                    media_data = f.read()
-            else:
-                media_type = f"application/{ext}"
-                # Keep other files as-is
-                with open(filepath, "rb") as f:
-                    media_data = f.read()
-            
-            # Check processed file size
-            if len(media_data) > MAX_FILE_SIZE:
-                QMessageBox.warning(self, "File Too Large", "The processed file still exceeds 100 MB limit.")
-                return
-                
-            self.messages_to_send.append({
-                "media_data": media_data,
-                "media_type": media_type,
-                "filename": filename
-            })
+        filepaths, _ = QFileDialog.getOpenFileNames(self, "Select files", "", "All Files (*)")
+        too_large = []
+        for filepath in filepaths:
+            if os.path.getsize(filepath) > MAX_FILE_SIZE:
+                too_large.append(os.path.basename(filepath))
+                continue
+            transfer = self.transfers.add(filepath, os.path.basename(filepath))
+            self.add_transfer_row(transfer)
+        if too_large:
+            QMessageBox.warning(self, "File Too Large", "These files exceed the 100 MB limit:\n" + "\n".join(too_large))
+
+    def add_transfer_row(self, transfer):
+        row = QWidget()
+        row_layout = QHBoxLayout(row)
+        row_layout.setContentsMargins(0, 0, 0, 0)
+        name_label = QLabel(transfer.filename)
+        name_label.setStyleSheet("font-size: 10px;")
+        row_layout.addWidget(name_label)
+        bar = QProgressBar()
+        bar.setMaximum(0)  # Busy indicator until the file is prepared
+        bar.setFixedHeight(12)
+        bar.setTextVisible(False)
+        row_layout.addWidget(bar)
+        cancel_btn = QPushButton("✕")
+        cancel_btn.setFixedSize(20, 20)
+        cancel_btn.clicked.connect(lambda: self.transfers.cancel(transfer.id))
+        row_layout.addWidget(cancel_btn)
+        self.transfer_layout.addWidget(row)
+        self.transfer_rows[transfer.id] = (row, bar)
+
+    def update_transfer_progress(self, transfer_id, sent, total):
+        if transfer_id in self.transfer_rows:
+            _, bar = self.transfer_rows[transfer_id]
+            bar.setMaximum(max(total, 1))
+            bar.setValue(sent)
+
+    def finish_transfer(self, transfer, error):
+        row, _ = self.transfer_rows.pop(transfer.id, (None, None))
+        if row is not None:
+            row.deleteLater()
+        if error == "cancelled":
+            self.create_system_message(f"Cancelled sending {transfer.filename}")
+        elif error:
+            QMessageBox.critical(self, "Error", f"Failed to send {transfer.filename}:\n{error}")
+        else:
             timestamp = datetime.now().strftime("%H:%M")
-            self.signal_handler.add_message_signal.emit(
-                filename, True, timestamp, media_data, media_type, self.username
+            self.create_message_bubble(
+                transfer.filename, True, timestamp, transfer.media_data, transfer.media_type, self.username
             )
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to send media:\n{e}")
 
-    def message_generator(self):
-        yield chat_pb2.ChatMessage(username=self.username, message="has joined the chat")
+    def message_generator(self, stream):
+        # Identify ourselves to the server; the other clients learn about the join through presence
+        yield chat_pb2.ChatMessage(username=self.username, presence=chat_pb2.PresenceUpdate(entries=[
+            chat_pb2.PresenceEntry(username=self.username, online=True, typing=False)
+        ]))
         while self.running:
-            if self.messages_to_send:
-                msg_obj = self.messages_to_send.pop(0)
-                if isinstance(msg_obj, dict):
-                    yield chat_pb2.ChatMessage(
-                        username=self.username,
-                        message=msg_obj.get("filename", ""),
-                        media_data=msg_obj.get("media_data", b""),
-                        media_type=msg_obj.get("media_type", "")
-                    )
+            with self.send_lock:
+                # A newer stream took over; gRPC may still ask this one for a message it would drop
+                if not stream["active"]:
+                    return
+                if self.messages_to_send:
+                    msg_obj = self.messages_to_send.pop(0)
                 else:
-                    yield chat_pb2.ChatMessage(username=self.username, message=msg_obj)
-            else:
+                    # Files go out one chunk at a time so queued text can slip in between
+                    msg_obj = self.transfers.next_message()
+                stream["in_flight"] = msg_obj
+            if msg_obj is None:
                 time.sleep(0.05)
+                continue
+
+            if isinstance(msg_obj, dict):
+                yield chat_pb2.ChatMessage(
+                    username=self.username,
+                    message=msg_obj.get("filename", ""),
+                    media_data=msg_obj.get("media_data", b""),
+                    media_type=msg_obj.get("media_type", "")
+                )
+            elif isinstance(msg_obj, chat_pb2.ChatMessage):
+                yield msg_obj
+            else:
+                yield chat_pb2.ChatMessage(username=self.username, message=msg_obj)
+
+            # gRPC only asks for the next message once this one was written
+            with self.send_lock:
+                stream["in_flight"] = None
+            if isinstance(msg_obj, chat_pb2.ChatMessage) and msg_obj.transfer_id and not msg_obj.cancelled:
+                self.transfers.confirm(msg_obj)
+
+    def on_text_edited(self, text):
+        if not text:
+            self.set_typing(False)
+            return
+        self.typing_timer.start(TYPING_IDLE_MS)
+        if not self.is_typing or time.time() - self.typing_sent_at > TYPING_REFRESH:
+            self.set_typing(True)
+
+    def set_typing(self, typing):
+        if not typing and not self.is_typing:
+            return
+        self.is_typing = typing
+        self.typing_sent_at = time.time()
+        if not typing:
+            self.typing_timer.stop()
+        self.messages_to_send.append(chat_pb2.ChatMessage(
+            username=self.username,
+            presence=chat_pb2.PresenceUpdate(entries=[
+                chat_pb2.PresenceEntry(username=self.username, online=True, typing=typing)
+            ])
+        ))
+
+    def update_presence(self, update):
+        """Apply a roster snapshot or delta from the server and refresh the indicators"""
+        if update.snapshot:
+            self.roster = {}
+        for entry in update.entries:
+            previous = self.roster.get(entry.username)
+            if not update.snapshot and entry.username != self.username:
+                if previous is not None and previous.online and not entry.online:
+                    self.create_system_message(f"{entry.username} has left the chat")
+                elif entry.online and (previous is None or not previous.online):
+                    self.create_system_message(f"{entry.username} has joined the chat")
+            self.roster[entry.username] = entry
+
+        online = sum(1 for entry in self.roster.values() if entry.online)
+        self.online_label.setText(f"{online} online")
+
+        typing = [name for name, entry in self.roster.items() if entry.typing and name != self.username]
+        if not typing:
+            self.typing_label.setText("")
+        elif len(typing) == 1:
+            self.typing_label.setText(f"{typing[0]} is typing...")
+        elif len(typing) <= 3:
+            self.typing_label.setText(f"{', '.join(typing)} are typing...")
+        else:
+            self.typing_label.setText(f"{len(typing)} people are typing...")
 
     def send_message(self):
         msg = self.entry.text().strip()
         if msg:
             self.entry.clear()
+            # The server clears our typing state when the message arrives
+            self.is_typing = False
+            self.typing_timer.stop()
             timestamp = datetime.now().strftime("%H:%M")
             self.messages_to_send.append(msg)
             self.signal_handler.add_message_signal.emit(msg, True, timestamp, b"", "", self.username)
 
-    def receive_messages(self):
-        try:
-            for response in self.stub.Chat(self.message_generator()):
-                timestamp = datetime.now().strftime("%H:%M")
-                
-                # Handle group picture updates
-                if response.media_type == "group_picture_update":
-                    if response.username != self.username:  # Only update if it's from someone else
-                        self.signal_handler.update_group_picture_signal.emit(response.media_data, response.username)
-                        self.signal_handler.system_message_signal.emit(f"{response.username} updated the group picture")
-                    continue
-                
-                # Skip own messages for regular chat
-                if response.username == self.username:
-                    continue
-                    
-                self.signal_handler.add_message_signal.emit(
-                    response.message, False, timestamp,
-                    response.media_data, response.media_type, response.username
+    def receive_messages(self, call, first):
+        while True:
+            try:
+                self.handle_response(first)
+                for response in call:
+                    self.handle_response(response)
+                self.end_stream()
+                return
+            except grpc.RpcError as e:
+                self.end_stream()
+                if not self.running:
+                    return
+                reconnected = self.reconnect(e)
+                if reconnected is None:
+                    QMessageBox.critical(self, "Disconnected", f"Lost connection to server:\n{e}")
+                    self.signal_handler.system_message_signal.emit("Disconnected from server.")
+                    return
+                call, first = reconnected
+
+    def handle_response(self, response):
+        timestamp = datetime.now().strftime("%H:%M")
+
+        if response.HasField("presence"):
+            # A sender that went offline will never finish its files
+            for entry in response.presence.entries:
+                if not entry.online:
+                    self.drop_partial_transfers(entry.username)
+            if response.presence.snapshot:
+                online = {entry.username for entry in response.presence.entries if entry.online}
+                for sender in {sender for sender, _ in self.incoming.values()} - online:
+                    self.drop_partial_transfers(sender)
+            self.signal_handler.presence_signal.emit(response.presence)
+            return
+        
+        # Handle group picture updates
+        if response.media_type == "group_picture_update":
+            if response.username != self.username:  # Only update if it's from someone else
+                self.signal_handler.update_group_picture_signal.emit(response.media_data, response.username)
+                self.signal_handler.system_message_signal.emit(f"{response.username} updated the group picture")
+            return
+        
+        # Skip own messages for regular chat
+        if response.username == self.username:
+            return
+
+        if response.transfer_id:
+            response = self.receive_chunk(response)
+            if response is None:
+                return
+            
+        self.signal_handler.add_message_signal.emit(
+            response.message, False, timestamp,
+            response.media_data, response.media_type, response.username
+        )
+        self.play_notification_sound()
+
+    def receive_chunk(self, chunk):
+        """Collect file chunks; returns the reassembled message once the last one arrives"""
+        if chunk.cancelled:
+            self.incoming.pop(chunk.transfer_id, None)
+            return None
+        _, chunks = self.incoming.setdefault(chunk.transfer_id, (chunk.username, []))
+        if chunk.chunk_index != len(chunks):
+            # Joined in the middle of this transfer, the start is gone
+            self.incoming.pop(chunk.transfer_id, None)
+            return None
+        chunks.append(chunk.media_data)
+        if chunk.chunk_index + 1 < chunk.chunk_count:
+            return None
+        del self.incoming[chunk.transfer_id]
+        return chat_pb2.ChatMessage(
+            username=chunk.username, message=chunk.message,
+            media_data=b"".join(chunks), media_type=chunk.media_type,
+        )
+
+    def drop_partial_transfers(self, sender):
+        for transfer_id, (username, _) in list(self.incoming.items()):
+            if username == sender:
+                del self.incoming[transfer_id]
+
+    def search_history(self):
+        query, ok = QInputDialog.getText(self, "Search", "Search message history:")
+        if not ok or not query.strip():
+            return
+
+        def run_search():
+            try:
+                response = self.stub.Search(
+                    chat_pb2.SearchRequest(query=query, page_size=20), timeout=10, metadata=self.auth_metadata()
                 )
-                self.play_notification_sound()
-        except grpc.RpcError as e:
-            QMessageBox.critical(self, "Disconnected", f"Lost connection to server:\n{e}")
-            self.signal_handler.system_message_signal.emit("Disconnected from server.")
+            except grpc.RpcError as e:
+                self.signal_handler.system_message_signal.emit(f"Search failed: {e.details()}")
+                return
+            if not response.hits:
+                self.signal_handler.system_message_signal.emit(f"No messages found for \"{query}\"")
+                return
+            lines = [f"Results for \"{query}\":"]
+            for hit in response.hits:
+                when = datetime.fromtimestamp(hit.timestamp).strftime("%d/%m %H:%M")
+                lines.append(f"[{when}] {hit.username}: {hit.snippet}")
+            self.signal_handler.system_message_signal.emit("\n".join(lines))
+
+        threading.Thread(target=run_search, daemon=True).start()
 
     def show_full_image(self, image_data, filename):
         """Display full-size HD image in a new window"""
@@ -521,6 +881,8 @@ class ChatClient(QMainWindow):
 
     def closeEvent(self, event):
         self.running = False
+        if self.transfers:
+            self.transfers.shutdown()
         if self.channel:
             self.channel.close()
         event.accept()
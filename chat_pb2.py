@@ -24,15 +24,29 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\"X\n\x0b\x43hatMessage\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x12\n\nmedia_data\x18\x03 \x01(\x0c\x12\x12\n\nmedia_type\x18\x04 \x01(\t25\n\x0b\x43hatService\x12&\n\x04\x43hat\x12\x0c.ChatMessage\x1a\x0c.ChatMessage(\x01\x30\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\"\xdb\x01\n\x0b\x43hatMessage\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x12\n\nmedia_data\x18\x03 \x01(\x0c\x12\x12\n\nmedia_type\x18\x04 \x01(\t\x12!\n\x08presence\x18\x05 \x01(\x0b\x32\x0f.PresenceUpdate\x12\x0c\n\x04room\x18\x06 \x01(\t\x12\x13\n\x0btransfer_id\x18\x07 \x01(\t\x12\x13\n\x0b\x63hunk_index\x18\x08 \x01(\r\x12\x13\n\x0b\x63hunk_count\x18\t \x01(\r\x12\x11\n\tcancelled\x18\n \x01(\x08\"T\n\rPresenceEntry\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06online\x18\x02 \x01(\x08\x12\x0e\n\x06typing\x18\x03 \x01(\x08\x12\x11\n\tlast_seen\x18\x04 \x01(\x01\"C\n\x0ePresenceUpdate\x12\x1f\n\x07\x65ntries\x18\x01 \x03(\x0b\x32\x0e.PresenceEntry\x12\x10\n\x08snapshot\x18\x02 \x01(\x08\"q\n\rSearchRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x0c\n\x04room\x18\x02 \x01(\t\x12\r\n\x05since\x18\x03 \x01(\x01\x12\r\n\x05until\x18\x04 \x01(\x01\x12\x11\n\tpage_size\x18\x05 \x01(\x05\x12\x12\n\npage_token\x18\x06 \x01(\t\"\x8f\x01\n\tSearchHit\x12\n\n\x02id\x18\x01 \x01(\x03\x12\x0c\n\x04room\x18\x02 \x01(\t\x12\x10\n\x08username\x18\x03 \x01(\t\x12\x0f\n\x07message\x18\x04 \x01(\t\x12\x12\n\nmedia_type\x18\x05 \x01(\t\x12\x11\n\ttimestamp\x18\x06 \x01(\x01\x12\x0f\n\x07snippet\x18\x07 \x01(\t\x12\r\n\x05score\x18\x08 \x01(\x01\"C\n\x0eSearchResponse\x12\x18\n\x04hits\x18\x01 \x03(\x0b\x32\n.SearchHit\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\"4\n\x0cLoginRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x12\n\ninvite_key\x18\x02 \x01(\t\"2\n\rLoginResponse\x12\r\n\x05token\x18\x01 \x01(\t\x12\x12\n\nexpires_at\x18\x02 \x01(\x01\x32\x88\x01\n\x0b\x43hatService\x12&\n\x04\x43hat\x12\x0c.ChatMessage\x1a\x0c.ChatMessage(\x01\x30\x01\x12)\n\x06Search\x12\x0e.SearchRequest\x1a\x0f.SearchResponse\x12&\n\x05Login\x12\r.LoginRequest\x1a\x0e.LoginResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'chat_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_CHATMESSAGE']._serialized_start=14
-  _globals['_CHATMESSAGE']._serialized_end=102
-  _globals['_CHATSERVICE']._serialized_start=104
-  _globals['_CHATSERVICE']._serialized_end=157
+  _globals['_CHATMESSAGE']._serialized_start=15
+  _globals['_CHATMESSAGE']._serialized_end=234
+  _globals['_PRESENCEENTRY']._serialized_start=236
+  _globals['_PRESENCEENTRY']._serialized_end=320
+  _globals['_PRESENCEUPDATE']._serialized_start=322
+  _globals['_PRESENCEUPDATE']._serialized_end=389
+  _globals['_SEARCHREQUEST']._serialized_start=391
+  _globals['_SEARCHREQUEST']._serialized_end=504
+  _globals['_SEARCHHIT']._serialized_start=507
+  _globals['_SEARCHHIT']._serialized_end=650
+  _globals['_SEARCHRESPONSE']._serialized_start=652
+  _globals['_SEARCHRESPONSE']._serialized_end=719
+  _globals['_LOGINREQUEST']._serialized_start=721
+  _globals['_LOGINREQUEST']._serialized_end=773
+  _globals['_LOGINRESPONSE']._serialized_start=775
+  _globals['_LOGINRESPONSE']._serialized_end=825
+  _globals['_CHATSERVICE']._serialized_start=828
+  _globals['_CHATSERVICE']._serialized_end=964
 # @@protoc_insertion_point(module_scope)
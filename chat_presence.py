@@ -0,0 +1,103 @@
+import collections
+import threading
+import time
+
+import chat_pb2
+
+# Typing state is dropped if the client stops refreshing it (e.g. it crashed mid-word)
+TYPING_TIMEOUT = 5.0
+# Offline users are kept for their last-seen time, but only the most recent ones
+MAX_OFFLINE = 200
+OFFLINE_RETENTION = 7 * 24 * 60 * 60
+
+class PresenceTracker:
+    """Online roster, last-seen times and typing state for the chat room.
+
+    Changes are only recorded as "dirty" usernames; drain() turns them into a
+    single delta, so the cost of a tick is O(changes) no matter how big the room is.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.users = {}         # username -> {"connections", "typing", "last_seen"}
+        self.typing_since = {}  # username -> time of the last typing refresh
+        self.offline = collections.OrderedDict()  # username -> time they left, oldest first
+        self.dirty = set()
+
+    def join(self, username):
+        """Mark a connection for username as online and return the current roster."""
+        with self.lock:
+            user = self.users.setdefault(username, {"connections": 0, "typing": False, "last_seen": 0.0})
+            user["connections"] += 1
+            user["last_seen"] = self.clock()
+            self.offline.pop(username, None)
+            if user["connections"] == 1:
+                self.dirty.add(username)
+            return self._snapshot_locked()
+
+    def leave(self, username):
+        with self.lock:
+            user = self.users.get(username)
+            if not user:
+                return
+            user["connections"] = max(0, user["connections"] - 1)
+            user["last_seen"] = self.clock()
+            if user["connections"] == 0:
+                user["typing"] = False
+                self.typing_since.pop(username, None)
+                self.offline[username] = user["last_seen"]
+                self.dirty.add(username)
+
+    def set_typing(self, username, typing):
+        with self.lock:
+            user = self.users.get(username)
+            if not user or not user["connections"]:
+                return
+            now = self.clock()
+            user["last_seen"] = now
+            if typing:
+                self.typing_since[username] = now
+            else:
+                self.typing_since.pop(username, None)
+            if user["typing"] != typing:
+                user["typing"] = typing
+                self.dirty.add(username)
+
+    def drain(self):
+        """Return the changed entries since the last call (possibly empty) and reset them."""
+        with self.lock:
+            now = self.clock()
+            expired = [u for u, t in self.typing_since.items() if now - t > TYPING_TIMEOUT]
+            for username in expired:
+                del self.typing_since[username]
+                self.users[username]["typing"] = False
+                self.dirty.add(username)
+
+            entries = [self._entry_locked(u) for u in self.dirty]
+            self.dirty = set()
+
+            # Forget the oldest offline users; done after the deltas so their "left" entry still goes out
+            while self.offline:
+                username, left_at = next(iter(self.offline.items()))
+                if len(self.offline) <= MAX_OFFLINE and now - left_at <= OFFLINE_RETENTION:
+                    break
+                del self.offline[username]
+                del self.users[username]
+            return entries
+
+    def snapshot(self):
+        with self.lock:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self):
+        return [self._entry_locked(u) for u in self.users]
+
+    def _entry_locked(self, username):
+        user = self.users[username]
+        return chat_pb2.PresenceEntry(
+            username=username,
+            online=user["connections"] > 0,
+            typing=user["typing"],
+            last_seen=user["last_seen"],
+        )
@@ -0,0 +1,224 @@
+import queue
+import sqlite3
+import threading
+import time
+
+import chat_pb2
+
+DEFAULT_ROOM = "general"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Matches are ranked in windows of this many, newest first, so a common word costs the same as a rare one
+MAX_CANDIDATES = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    username TEXT NOT NULL,
+    message TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_room_time ON messages (room, timestamp);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (timestamp);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    message, username,
+    content='messages', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, message, username) VALUES (new.id, new.message, new.username);
+END;
+"""
+
+def fts_query(text):
+    """Turn free text into an FTS5 query where every word must match (quoted, so no operators)"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+def encode_page_token(window_top, offset):
+    return f"{window_top}:{offset}"
+
+def decode_page_token(token):
+    """Return (window_top, offset) of the next page; raises ValueError if malformed"""
+    window_top, offset = (int(part) for part in token.split(":"))
+    if window_top < 0 or offset < 0:
+        raise ValueError(f"Invalid page token: {token}")
+    return window_top, offset
+
+class MessageIndex:
+    """SQLite FTS5 index over the chat history.
+
+    add() only enqueues, so the broadcast path never waits on the disk; a
+    writer thread commits the queue in batches. Searches use their own
+    per-thread connections and, thanks to WAL, never block the writer.
+    Messages are stored in timestamp order, so their ids follow their
+    timestamps and a time range is also an id range.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=0.2):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue()
+        self.local = threading.local()
+        self.add_lock = threading.Lock()
+
+        db = self._connect()
+        db.executescript(SCHEMA)
+        self.last_timestamp = db.execute("SELECT max(timestamp) FROM messages").fetchone()[0] or 0.0
+        db.close()
+
+        self.writer = threading.Thread(target=self._write_batches, daemon=True)
+        self.writer.start()
+
+    def add(self, chat_message, timestamp=None):
+        # Stamped and queued together so ids keep following timestamps, even if the clock steps back
+        with self.add_lock:
+            if timestamp is None:
+                timestamp = max(time.time(), self.last_timestamp)
+            self.last_timestamp = timestamp
+            self.pending.put((
+                chat_message.room or DEFAULT_ROOM,
+                chat_message.username,
+                chat_message.message,
+                chat_message.media_type,
+                timestamp,
+            ))
+
+    def flush(self):
+        """Block until everything added so far is searchable"""
+        self.pending.join()
+
+    def search(self, query, room="", since=0.0, until=0.0, limit=DEFAULT_PAGE_SIZE, page_token=""):
+        """Return (hits, next_page_token); next_page_token is "" once every match was returned.
+
+        Matches are ranked by bm25 in windows of the MAX_CANDIDATES newest
+        ones: pages go through the best hits of the newest window, then of
+        the next older one, and so on. The page token holds the newest id of
+        the current window and the position in it rather than a score (bm25
+        changes as the corpus grows), so messages indexed while paging
+        neither join a search already underway nor push its hits off a page.
+        """
+        match = fts_query(query)
+        if not match:
+            return [], ""
+
+        db = self._reader()
+        id_range = self._id_range(db, since, until)
+        if id_range is None:
+            return [], ""
+        first_id, window_top = id_range
+        offset = 0
+        if page_token:
+            token_top, offset = decode_page_token(page_token)
+            window_top = min(window_top, token_top)
+
+        # The id range lets FTS5 skip straight to the window instead of walking newer matches
+        filters = ""
+        filter_params = []
+        if room:
+            filters += " AND m.room = ?"
+            filter_params.append(room)
+        if since:
+            filters += " AND m.timestamp >= ?"
+            filter_params.append(since)
+        if until:
+            filters += " AND m.timestamp < ?"
+            filter_params.append(until)
+        matches = f"""
+            FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ? AND messages_fts.rowid BETWEEN ? AND ?{filters}
+        """
+
+        # The window's size and oldest id come along with every row of the page
+        ranked = db.execute(f"""
+            SELECT id, score, count(*) OVER (), min(id) OVER () FROM (
+                SELECT m.id AS id, bm25(messages_fts) AS score {matches}
+                ORDER BY messages_fts.rowid DESC LIMIT ?
+            )
+            ORDER BY score, id DESC LIMIT ? OFFSET ?
+        """, [match, first_id, window_top] + filter_params + [MAX_CANDIDATES, limit, offset]).fetchall()
+        if not ranked:
+            return [], ""
+        page = [(message_id, score) for message_id, score, _, _ in ranked]
+        window_size, window_bottom = ranked[0][2], ranked[0][3]
+
+        # Snippets are only built for the hits on this page
+        ids = [message_id for message_id, _ in page]
+        rows = db.execute(f"""
+            SELECT m.id, m.room, m.username, m.message, m.media_type, m.timestamp,
+                   snippet(messages_fts, 0, '[', ']', '...', 12)
+            FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ? AND messages_fts.rowid IN ({",".join("?" * len(ids))})
+        """, [match] + ids).fetchall()
+        details = {row[0]: row for row in rows}
+
+        hits = [
+            chat_pb2.SearchHit(
+                id=message_id, room=details[message_id][1], username=details[message_id][2],
+                message=details[message_id][3], media_type=details[message_id][4],
+                timestamp=details[message_id][5], snippet=details[message_id][6], score=-score,
+            )
+            for message_id, score in page
+        ]
+        if offset + limit < window_size:
+            return hits, encode_page_token(window_top, offset + limit)
+        if window_size == MAX_CANDIDATES and db.execute(
+            f"SELECT 1 {matches} LIMIT 1", [match, first_id, window_bottom - 1] + filter_params
+        ).fetchone():
+            return hits, encode_page_token(window_bottom - 1, 0)
+        return hits, ""
+
+    def _id_range(self, db, since, until):
+        """Return the (first, last) message ids inside the time range, or None if it is empty"""
+        first = db.execute(
+            "SELECT id FROM messages WHERE timestamp >= ? ORDER BY timestamp, id LIMIT 1", (since,)
+        ).fetchone()
+        if until:
+            last = db.execute(
+                "SELECT id FROM messages WHERE timestamp < ? ORDER BY timestamp DESC, id DESC LIMIT 1", (until,)
+            ).fetchone()
+        else:
+            last = db.execute("SELECT max(id) FROM messages").fetchone()
+        if first is None or last is None or last[0] is None or first[0] > last[0]:
+            return None
+        return first[0], last[0]
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = self._connect()
+        return db
+
+    def _write_batches(self):
+        db = self._connect()
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with db:
+                    db.executemany(
+                        "INSERT INTO messages (room, username, message, media_type, timestamp) VALUES (?, ?, ?, ?, ?)",
+                        batch,
+                    )
+            except sqlite3.Error as e:
+                print(f"Index error: {e}")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
@@ -0,0 +1,214 @@
+import base64
+import collections
+import datetime
+import hashlib
+import hmac
+import ipaddress
+import os
+import secrets
+import socket
+import threading
+import time
+
+import grpc
+
+TOKEN_TTL = 12 * 60 * 60  # 12 hours
+
+def generate_certificates(directory, hosts=()):
+    """Create a self-signed server certificate in directory (reused if already there).
+
+    Returns (key_path, cert_path). Clients pin the certificate file as their root.
+    """
+    key_path = os.path.join(directory, "server.key")
+    cert_path = os.path.join(directory, "server.crt")
+    if os.path.exists(key_path) and os.path.exists(cert_path):
+        return key_path, cert_path
+
+    try:
+        from cryptography import x509
+        from cryptography.x509.oid import NameOID
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+    except ImportError:
+        raise RuntimeError("Generating TLS certificates requires the 'cryptography' package (pip install cryptography)")
+
+    names = {"localhost", "127.0.0.1", socket.gethostname(), *hosts}
+    alt_names = []
+    for name in sorted(names):
+        try:
+            alt_names.append(x509.IPAddress(ipaddress.ip_address(name)))
+        except ValueError:
+            alt_names.append(x509.DNSName(name))
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "rpc chat server")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName(alt_names), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    # Owner-only before any key material is written, so the key is never readable by others
+    with os.fdopen(os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+        os.fchmod(f.fileno(), 0o600)  # The mode above only applies to a newly created file
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return key_path, cert_path
+
+def server_credentials(key_path, cert_path):
+    with open(key_path, "rb") as f:
+        key = f.read()
+    with open(cert_path, "rb") as f:
+        cert = f.read()
+    return grpc.ssl_server_credentials([(key, cert)])
+
+class TokenIssuer:
+    """Stateless HMAC-signed session tokens: "<username>.<expiry>.<nonce>.<signature>".
+
+    The nonce makes every login's token distinct, even within the same second.
+    """
+
+    def __init__(self, secret=None, ttl=TOKEN_TTL):
+        self.secret = secret or secrets.token_bytes(32)
+        self.ttl = ttl
+
+    def issue(self, username):
+        expires_at = int(time.time() + self.ttl)
+        payload = f"{base64.urlsafe_b64encode(username.encode()).decode()}.{expires_at}.{secrets.token_hex(8)}"
+        return f"{payload}.{self._sign(payload)}", expires_at
+
+    def verify(self, token):
+        """Return (username, expires_at) for a valid token, otherwise None"""
+        try:
+            encoded_name, expires_at, nonce, signature = token.split(".")
+            payload = f"{encoded_name}.{expires_at}.{nonce}"
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            if int(expires_at) < time.time():
+                return None
+            return base64.urlsafe_b64decode(encoded_name).decode(), int(expires_at)
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()
+
+def bearer_token(metadata):
+    for key, value in metadata or ():
+        if key == "authorization" and value.startswith("Bearer "):
+            return value[len("Bearer "):]
+    return ""
+
+class SessionCache:
+    """Validated sessions of the calls in progress, keyed by (peer, token), i.e. per connection.
+
+    The first call on a connection verifies the token; calls made while another
+    one is open on that connection (the chat stream, in practice) and the
+    servicer asking who the caller is only do a dict lookup. An entry goes
+    away with the last call using it, so the cache never outgrows the open calls.
+
+    A username belongs to whoever holds its most recent token: logging in
+    again revokes older tokens, and nobody can log in under a name that is
+    currently connected.
+    """
+
+    def __init__(self, issuer):
+        self.issuer = issuer
+        self.lock = threading.Lock()
+        self.sessions = {}  # (peer, token) -> [username, expires_at, open calls]
+        self.latest = {}  # username -> most recently issued token
+        self.active = collections.Counter()  # username -> open calls
+
+    def login(self, username):
+        """Return (token, expires_at), or None if username is connected right now"""
+        with self.lock:
+            if self.active[username]:
+                return None
+            token, expires_at = self.issuer.issue(username)
+            self.latest[username] = token
+        return token, expires_at
+
+    def authenticate(self, context, token):
+        """Validate token for the call behind context; the session stays cached until the call ends"""
+        if not token:
+            return None
+        key = (context.peer(), token)
+        with self.lock:
+            session = self.sessions.get(key)
+        if session is None:
+            verified = self.issuer.verify(token)
+            if verified is None:
+                return None
+            username, expires_at = verified
+        else:
+            username, expires_at = session[0], session[1]
+
+        with self.lock:
+            if expires_at < time.time() or self.latest.get(username) != token:
+                return None
+            session = self.sessions.setdefault(key, [username, expires_at, 0])
+            session[2] += 1
+            self.active[username] += 1
+        if not context.add_callback(lambda: self._release(key)):
+            self._release(key)  # The call already ended
+        return username
+
+    def username(self, context):
+        """Who is making this call; only valid inside a call that passed authenticate()"""
+        key = (context.peer(), bearer_token(context.invocation_metadata()))
+        with self.lock:
+            session = self.sessions.get(key)
+        return session[0] if session else None
+
+    def _release(self, key):
+        with self.lock:
+            session = self.sessions[key]
+            session[2] -= 1
+            if not session[2]:
+                del self.sessions[key]
+            self.active[session[0]] -= 1
+            if not self.active[session[0]]:
+                del self.active[session[0]]
+
+class AuthInterceptor(grpc.ServerInterceptor):
+    """Rejects calls without a valid session token, except for the methods in public_methods"""
+
+    def __init__(self, sessions, public_methods=()):
+        self.sessions = sessions
+        self.public_methods = set(public_methods)
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler_call_details.method in self.public_methods:
+            return handler
+
+        token = bearer_token(handler_call_details.invocation_metadata)
+
+        def wrap(behavior):
+            def authenticated(request, context):
+                if self.sessions.authenticate(context, token) is None:
+                    context.abort(grpc.StatusCode.UNAUTHENTICATED, "Invalid or expired session token")
+                return behavior(request, context)
+            return authenticated
+
+        if handler.unary_unary:
+            return handler._replace(unary_unary=wrap(handler.unary_unary))
+        if handler.unary_stream:
+            return handler._replace(unary_stream=wrap(handler.unary_stream))
+        if handler.stream_unary:
+            return handler._replace(stream_unary=wrap(handler.stream_unary))
+        return handler._replace(stream_stream=wrap(handler.stream_stream))
@@ -1,5 +1,8 @@
 import grpc
 from concurrent import futures
+import argparse
+import hmac
+import os
 import threading
 import time
 import socket
@@ -7,11 +10,22 @@ import signal
 
 import chat_pb2
 import chat_pb2_grpc
+from chat_presence import PresenceTracker
+from chat_search import MessageIndex, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from chat_security import AuthInterceptor, SessionCache, TokenIssuer, generate_certificates, server_credentials
 
 # Store connected clients
 clients_lock = threading.Lock()
 connected_clients = set()
 
+# Presence deltas are coalesced and broadcast once per tick instead of per keystroke
+PRESENCE_TICK = 0.5
+presence = PresenceTracker()
+
+HISTORY_DB = "chat_history.db"
+DEFAULT_PORT = 50051
+CERTS_DIR = "certs"
+
 def get_local_ip():
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -27,7 +41,30 @@ class Client:
         self.messages = []
         self.condition = threading.Condition()
 
+    def push(self, message):
+        with self.condition:
+            self.messages.append(message)
+            self.condition.notify()
+
+def broadcast(data):
+    """Queue already-serialized bytes for every client; the same object is shared by all of them"""
+    with clients_lock:
+        for c in connected_clients:
+            c.push(data)
+
+def broadcast_presence():
+    while True:
+        time.sleep(PRESENCE_TICK)
+        entries = presence.drain()
+        if entries:
+            broadcast(chat_pb2.ChatMessage(presence=chat_pb2.PresenceUpdate(entries=entries)).SerializeToString())
+
 class ChatService(chat_pb2_grpc.ChatServiceServicer):
+    def __init__(self, index=None, sessions=None, invite_key=""):
+        self.index = index
+        self.sessions = sessions  # None when the server runs without authentication
+        self.invite_key = invite_key
+
     def Chat(self, request_iterator, context):
         client = Client()
 
@@ -36,51 +73,160 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
             connected_clients.add(client)
 
         def send_messages():
-            while True:
+            while context.is_active():
                 with client.condition:
-                    while not client.messages:
-                        client.condition.wait()
+                    # Wake up periodically so a disconnected client releases its worker thread
+                    if not client.messages and not client.condition.wait(timeout=1.0):
+                        continue
                     msg = client.messages.pop(0)
-                    yield msg
+                yield msg
+
+        # With authentication the session decides who this is, not the username field
+        authenticated_user = self.sessions.username(context) if self.sessions else None
 
         def receive_messages():
+            username = None
             try:
-                for chat_message in request_iterator:
-                    # Broadcast to all clients
-                    with clients_lock:
-                        for c in connected_clients:
-                            with c.condition:
-                                c.messages.append(chat_message)
-                                c.condition.notify()
+                for data in request_iterator:
+                    chat_message = chat_pb2.ChatMessage.FromString(data)
+                    if authenticated_user is not None and chat_message.username != authenticated_user:
+                        chat_message.username = authenticated_user
+                        data = chat_message.SerializeToString()
+
+                    # The first message identifies the user; answer it with a roster snapshot
+                    if username is None:
+                        username = chat_message.username
+                        snapshot = presence.join(username)
+                        client.push(chat_pb2.ChatMessage(
+                            presence=chat_pb2.PresenceUpdate(entries=snapshot, snapshot=True)
+                        ).SerializeToString())
+
+                    # Typing updates only feed the tracker, they are never broadcast directly
+                    if chat_message.HasField("presence"):
+                        for entry in chat_message.presence.entries:
+                            presence.set_typing(username, entry.typing)
+                        continue
+
+                    presence.set_typing(username, False)
+                    # Relay the bytes exactly as received instead of re-encoding per recipient
+                    broadcast(data)
+
+                    # Indexing is queued and batched off the broadcast path; a file is indexed once
+                    # its last chunk arrives, so cancelled transfers never show up in search
+                    last_chunk = not chat_message.transfer_id or chat_message.chunk_index + 1 == chat_message.chunk_count
+                    if (self.index and chat_message.media_type != "group_picture_update"
+                            and last_chunk and not chat_message.cancelled):
+                        self.index.add(chat_message)
             except Exception as e:
                 print(f"Receive error: {e}")
             finally:
                 # Remove client on disconnect
                 with clients_lock:
                     connected_clients.discard(client)
+                if username is not None:
+                    presence.leave(username)
 
         threading.Thread(target=receive_messages, daemon=True).start()
         yield from send_messages()
 
-def serve():
+    def Search(self, request, context):
+        if not self.index:
+            context.abort(grpc.StatusCode.UNIMPLEMENTED, "Message history is disabled")
+        if not request.query.strip():
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Empty search query")
+        limit = min(max(request.page_size, 0) or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+        try:
+            hits, next_page_token = self.index.search(
+                request.query, room=request.room, since=request.since, until=request.until,
+                limit=limit, page_token=request.page_token,
+            )
+        except ValueError:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Invalid page token")
+        return chat_pb2.SearchResponse(hits=hits, next_page_token=next_page_token)
+
+    def Login(self, request, context):
+        if not self.sessions:
+            context.abort(grpc.StatusCode.FAILED_PRECONDITION, "Authentication is disabled on this server")
+        if not request.username.strip():
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Missing username")
+        if not hmac.compare_digest(request.invite_key.encode(), self.invite_key.encode()):
+            context.abort(grpc.StatusCode.UNAUTHENTICATED, "Wrong invite key")
+        session = self.sessions.login(request.username.strip())
+        if session is None:
+            context.abort(grpc.StatusCode.ALREADY_EXISTS, f"{request.username.strip()} is already connected")
+        token, expires_at = session
+        return chat_pb2.LoginResponse(token=token, expires_at=expires_at)
+
+def add_chat_service_to_server(servicer, server):
+    """Like chat_pb2_grpc.add_ChatServiceServicer_to_server, but Chat streams raw bytes.
+
+    Without serializers gRPC hands the servicer the encoded request and writes
+    the yielded bytes as-is, so a message is parsed once and never re-encoded,
+    however many clients it fans out to.
+    """
+    rpc_method_handlers = {
+            'Chat': grpc.stream_stream_rpc_method_handler(servicer.Chat),
+            'Search': grpc.unary_unary_rpc_method_handler(
+                    servicer.Search,
+                    request_deserializer=chat_pb2.SearchRequest.FromString,
+                    response_serializer=chat_pb2.SearchResponse.SerializeToString,
+            ),
+            'Login': grpc.unary_unary_rpc_method_handler(
+                    servicer.Login,
+                    request_deserializer=chat_pb2.LoginRequest.FromString,
+                    response_serializer=chat_pb2.LoginResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'ChatService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('ChatService', rpc_method_handlers)
+
+def create_server(address, index=None, certs_dir=None, invite_key=None, hosts=()):
+    """Build the chat server; returns (server, bound_port).
+
+    certs_dir enables TLS with a self-signed certificate generated there on
+    first use. invite_key enables token authentication: clients trade it for
+    a session token through Login and send that token with every call.
+    """
     # ✅ Allow messages up to 100 MB
     options = [
         ('grpc.max_send_message_length', 100 * 1024 * 1024),
         ('grpc.max_receive_message_length', 100 * 1024 * 1024),
     ]
 
+    sessions = SessionCache(TokenIssuer()) if invite_key else None
+    interceptors = [AuthInterceptor(sessions, public_methods=["/ChatService/Login"])] if sessions else []
+
     server = grpc.server(
         futures.ThreadPoolExecutor(max_workers=10),
-        options=options  # 👈 Critical to support large files
+        options=options,  # 👈 Critical to support large files
+        interceptors=interceptors,
     )
-    chat_pb2_grpc.add_ChatServiceServicer_to_server(ChatService(), server)
-    server.add_insecure_port('0.0.0.0:50051')
-
+    add_chat_service_to_server(ChatService(index, sessions, invite_key or ""), server)
+    if certs_dir:
+        key_path, cert_path = generate_certificates(certs_dir, hosts)
+        port = server.add_secure_port(address, server_credentials(key_path, cert_path))
+    else:
+        port = server.add_insecure_port(address)
+    return server, port
+
+def serve(port=DEFAULT_PORT, certs_dir=None, invite_key=None):
     local_ip = get_local_ip()
-    print(f"Starting gRPC chat server on {local_ip}:50051")
+    server, port = create_server(
+        f"0.0.0.0:{port}", MessageIndex(HISTORY_DB), certs_dir, invite_key, hosts=[local_ip]
+    )
+
+    print(f"Starting gRPC chat server on {local_ip}:{port}")
     print(f"Invite your friends with this IP: {local_ip}")
+    if certs_dir:
+        print(f"TLS enabled, share {os.path.join(certs_dir, 'server.crt')} with your friends")
+    if invite_key:
+        print("Token authentication enabled, friends need the invite key to join")
 
     server.start()
+    threading.Thread(target=broadcast_presence, daemon=True).start()
 
     def shutdown_handler(signum, frame):
         print("\nServer stopping gracefully...")
@@ -98,4 +244,10 @@ def serve():
         server.stop(0)
 
 if __name__ == '__main__':
-    serve()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="gRPC chat server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--tls", action="store_true", help=f"serve over TLS with a self-signed certificate in ./{CERTS_DIR}")
+    parser.add_argument("--invite-key", default=os.environ.get("CHAT_INVITE_KEY"),
+                        help="require this key to log in (default: $CHAT_INVITE_KEY)")
+    args = parser.parse_args()
+    serve(args.port, CERTS_DIR if args.tls else None, args.invite_key)
\ No newline at end of file
@@ -0,0 +1,147 @@
+import collections
+import threading
+import uuid
+from concurrent import futures
+
+import chat_pb2
+
+CHUNK_SIZE = 1024 * 1024  # 1MB, small enough to interleave text between chunks
+
+class Transfer:
+    def __init__(self, filepath, filename):
+        self.id = uuid.uuid4().hex
+        self.wire_id = self.id  # Changes when the transfer is restarted after a broken stream
+        self.filepath = filepath
+        self.filename = filename
+        self.media_data = None
+        self.media_type = ""
+        self.chunk_index = 0
+        self.chunk_count = 0
+        self.cancelled = False
+
+class TransferManager:
+    """Prepares files on a thread pool and streams them as chunks.
+
+    The chat stream asks for one message at a time through next_message(), which
+    round-robins between ready transfers, so several uploads make progress
+    together and text queued in between is never stuck behind a big file.
+    Progress only moves when the stream confirms a chunk was written, and a
+    transfer only finishes once its last chunk is confirmed.
+    Callbacks run on worker or gRPC threads; GUI code should forward them
+    through Qt signals.
+    """
+
+    def __init__(self, username, prepare, on_progress, on_finished, max_workers=4):
+        self.username = username
+        self.prepare = prepare          # filepath -> (media_data, media_type)
+        self.on_progress = on_progress  # (transfer, sent, total)
+        self.on_finished = on_finished  # (transfer, error or None)
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.transfers = {}
+        self.ready = collections.deque()
+        self.control = collections.deque()  # Cancel notices for transfers already on the wire
+
+    def add(self, filepath, filename):
+        transfer = Transfer(filepath, filename)
+        with self.lock:
+            self.transfers[transfer.id] = transfer
+        future = self.executor.submit(self.prepare, filepath)
+        future.add_done_callback(lambda f: self._prepared(transfer, f))
+        return transfer
+
+    def cancel(self, transfer_id):
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+            if transfer is None:
+                return
+            if transfer.chunk_count and transfer.chunk_index == transfer.chunk_count:
+                # The last chunk is already out: receivers have the file, so let confirm() finish it
+                return
+            del self.transfers[transfer_id]
+            transfer.cancelled = True
+            if transfer in self.ready:
+                self.ready.remove(transfer)
+            if transfer.chunk_index:
+                self.control.append(self._cancel_notice(transfer))
+        transfer.media_data = None
+        self.on_finished(transfer, "cancelled")
+
+    def next_message(self):
+        """Return the next chunk (or cancel notice) to put on the stream, or None when idle"""
+        with self.lock:
+            if self.control:
+                return self.control.popleft()
+            if not self.ready:
+                return None
+            transfer = self.ready.popleft()
+            start = transfer.chunk_index * CHUNK_SIZE
+            msg = chat_pb2.ChatMessage(
+                username=self.username,
+                message=transfer.filename,
+                media_data=transfer.media_data[start:start + CHUNK_SIZE],
+                media_type=transfer.media_type,
+                transfer_id=transfer.wire_id,
+                chunk_index=transfer.chunk_index,
+                chunk_count=transfer.chunk_count,
+            )
+            transfer.chunk_index += 1
+            if transfer.chunk_index < transfer.chunk_count:
+                self.ready.append(transfer)
+        return msg
+
+    def confirm(self, msg):
+        """Record that a chunk from next_message() was written to the stream"""
+        with self.lock:
+            transfer = next((t for t in self.transfers.values() if t.wire_id == msg.transfer_id), None)
+            if transfer is None:
+                return  # Cancelled, or restarted under a new wire id
+            total = len(transfer.media_data)
+            sent = min((msg.chunk_index + 1) * CHUNK_SIZE, total)
+            done = msg.chunk_index + 1 == msg.chunk_count
+            if done:
+                del self.transfers[transfer.id]
+
+        self.on_progress(transfer, sent, total)
+        if done:
+            self.on_finished(transfer, None)
+
+    def restart(self):
+        """Start every transfer that was on the wire over, after the stream broke.
+
+        Receivers may be missing any part of it, so they are told to drop the
+        old wire id and the file is resent from its first chunk under a new one.
+        """
+        with self.lock:
+            restarted = [t for t in self.transfers.values() if t.chunk_index]
+            for transfer in restarted:
+                self.control.append(self._cancel_notice(transfer))
+                transfer.wire_id = uuid.uuid4().hex
+                transfer.chunk_index = 0
+                if transfer not in self.ready:
+                    self.ready.append(transfer)
+
+        for transfer in restarted:
+            self.on_progress(transfer, 0, len(transfer.media_data))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _cancel_notice(self, transfer):
+        return chat_pb2.ChatMessage(username=self.username, transfer_id=transfer.wire_id, cancelled=True)
+
+    def _prepared(self, transfer, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        with self.lock:
+            if transfer.cancelled:
+                return
+            if error is None:
+                transfer.media_data, transfer.media_type = future.result()
+                transfer.chunk_count = max(1, -(-len(transfer.media_data) // CHUNK_SIZE))
+                self.ready.append(transfer)
+            else:
+                self.transfers.pop(transfer.id, None)
+        if error is not None:
+            self.on_finished(transfer, str(error))
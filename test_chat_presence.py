@@ -0,0 +1,79 @@
+import chat_presence
+from chat_presence import PresenceTracker, TYPING_TIMEOUT
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def entries_by_name(entries):
+    return {e.username: (e.online, e.typing) for e in entries}
+
+def test_join_returns_snapshot_and_marks_online():
+    tracker = PresenceTracker(FakeClock())
+    tracker.join("alice")
+    snapshot = tracker.join("bob")
+    assert entries_by_name(snapshot) == {"alice": (True, False), "bob": (True, False)}
+    assert entries_by_name(tracker.drain()) == {"alice": (True, False), "bob": (True, False)}
+    assert tracker.drain() == []
+
+def test_second_connection_does_not_produce_a_delta():
+    tracker = PresenceTracker(FakeClock())
+    tracker.join("alice")
+    tracker.drain()
+    tracker.join("alice")
+    tracker.leave("alice")
+    assert tracker.drain() == []
+
+def test_leave_reports_offline_with_last_seen():
+    clock = FakeClock()
+    tracker = PresenceTracker(clock)
+    tracker.join("alice")
+    tracker.set_typing("alice", True)
+    tracker.drain()
+    clock.now += 30
+    tracker.leave("alice")
+    [entry] = tracker.drain()
+    assert (entry.online, entry.typing, entry.last_seen) == (False, False, clock.now)
+
+def test_typing_changes_are_coalesced():
+    tracker = PresenceTracker(FakeClock())
+    tracker.join("alice")
+    tracker.drain()
+    for _ in range(10):
+        tracker.set_typing("alice", True)
+    assert entries_by_name(tracker.drain()) == {"alice": (True, True)}
+    tracker.set_typing("alice", False)
+    tracker.set_typing("alice", True)
+    assert entries_by_name(tracker.drain()) == {"alice": (True, True)}
+
+def test_typing_expires_without_refresh():
+    clock = FakeClock()
+    tracker = PresenceTracker(clock)
+    tracker.join("alice")
+    tracker.set_typing("alice", True)
+    tracker.drain()
+    clock.now += TYPING_TIMEOUT / 2
+    tracker.set_typing("alice", True)
+    clock.now += TYPING_TIMEOUT / 2 + 1
+    assert tracker.drain() == []
+    clock.now += TYPING_TIMEOUT
+    assert entries_by_name(tracker.drain()) == {"alice": (True, False)}
+
+def test_offline_users_are_pruned(monkeypatch):
+    monkeypatch.setattr(chat_presence, "MAX_OFFLINE", 2)
+    clock = FakeClock()
+    tracker = PresenceTracker(clock)
+    for name in ["a", "b", "c", "d"]:
+        tracker.join(name)
+        clock.now += 1
+        tracker.leave(name)
+    tracker.join("online")
+    assert len(tracker.drain()) == 5
+    assert sorted(e.username for e in tracker.snapshot()) == ["c", "d", "online"]
+
+    clock.now += chat_presence.OFFLINE_RETENTION + 10
+    tracker.drain()
+    assert [e.username for e in tracker.snapshot()] == ["online"]
@@ -0,0 +1,76 @@
+import pytest
+
+import chat_pb2
+import chat_search
+from chat_search import MessageIndex
+
+@pytest.fixture
+def index(tmp_path):
+    index = MessageIndex(str(tmp_path / "history.db"))
+    for i in range(25):
+        words = "pizza " * (1 + i % 3) + f"number{i}"
+        index.add(chat_pb2.ChatMessage(username="alice", message=words, room="food" if i < 20 else "misc"),
+                  timestamp=1000 + i)
+    index.flush()
+    return index
+
+def test_keyset_pages_cover_every_hit_once(index):
+    seen, token = [], ""
+    while True:
+        hits, token = index.search("pizza", limit=7, page_token=token)
+        seen += [hit.id for hit in hits]
+        if not token:
+            break
+    assert sorted(seen) == list(range(1, 26))
+
+def test_hits_are_ranked_best_first(index):
+    hits, _ = index.search("pizza", limit=25)
+    scores = [hit.score for hit in hits]
+    assert scores == sorted(scores, reverse=True)
+
+def test_room_and_time_filters(index):
+    hits, _ = index.search("pizza", room="misc", limit=25)
+    assert {hit.room for hit in hits} == {"misc"} and len(hits) == 5
+    hits, _ = index.search("pizza", since=1010, until=1015, limit=25)
+    assert sorted(hit.timestamp for hit in hits) == [1010, 1011, 1012, 1013, 1014]
+
+def test_writes_between_pages_do_not_skip_or_repeat(index):
+    hits, token = index.search("pizza", limit=10)
+    seen = [hit.id for hit in hits]
+    for i in range(200):
+        index.add(chat_pb2.ChatMessage(username="bob", message=f"unrelated chatter {i}" + " pizza" * (i % 2)),
+                  timestamp=2000 + i)
+    index.flush()
+    while token:
+        hits, token = index.search("pizza", limit=10, page_token=token)
+        seen += [hit.id for hit in hits]
+    assert sorted(seen) == list(range(1, 26))
+
+def test_matches_are_ranked_in_windows_newest_first(index, monkeypatch):
+    monkeypatch.setattr(chat_search, "MAX_CANDIDATES", 5)
+    hits, token = index.search("pizza", limit=25)
+    assert sorted(hit.id for hit in hits) == [21, 22, 23, 24, 25] and token
+
+    windows = []
+    while token:
+        hits, token = index.search("pizza", limit=3, page_token=token)
+        windows += [hit.id for hit in hits]
+    assert sorted(windows) == list(range(1, 21))
+    # Each window is fully returned before the next older one starts
+    assert [max(windows[i:i + 5]) for i in range(0, 20, 5)] == [20, 15, 10, 5]
+
+def test_time_range_is_an_id_range(index, monkeypatch):
+    monkeypatch.setattr(chat_search, "MAX_CANDIDATES", 3)
+    seen, token = [], ""
+    while True:
+        hits, token = index.search("pizza", since=1002, until=1010, limit=2, page_token=token)
+        seen += [hit.timestamp for hit in hits]
+        if not token:
+            break
+    assert sorted(seen) == list(range(1002, 1010))
+    assert index.search("pizza", since=5000) == ([], "")
+
+def test_malformed_page_token(index):
+    for token in ["nope", "1:2:3", "-1:0"]:
+        with pytest.raises(ValueError):
+            index.search("pizza", page_token=token)
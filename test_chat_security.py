@@ -0,0 +1,240 @@
+import os
+import stat
+import statistics
+import threading
+import time
+
+import grpc
+import pytest
+from grpc.experimental import session_cache
+
+import chat_pb2
+import chat_pb2_grpc
+import chat_server
+from chat_security import TokenIssuer, generate_certificates
+
+INVITE_KEY = "secret"
+# On loopback a TLS connect costs about 3x an insecure one (extra handshake round trip and
+# key exchange); the bound is loose enough for a busy machine but catches e.g. a full
+# handshake per call or a token check that hits the disk.
+TLS_LATENCY_FACTOR = 10
+TLS_LATENCY_SLACK = 0.02  # seconds
+LATENCY_ROUNDS = 20
+
+def test_token_round_trip():
+    issuer = TokenIssuer()
+    token, expires_at = issuer.issue("alice.bob")
+    assert issuer.verify(token) == ("alice.bob", expires_at)
+
+def test_expired_token_is_rejected():
+    issuer = TokenIssuer(ttl=-1)
+    token, _ = issuer.issue("alice")
+    assert issuer.verify(token) is None
+
+@pytest.mark.parametrize("tamper", [
+    lambda t: t[:-1] + ("0" if t[-1] != "0" else "1"),  # signature
+    lambda t: "Ym9i" + t[t.index("."):],  # username swapped for "bob"
+    lambda t: t.replace(t.split(".")[1], str(int(t.split(".")[1]) + 3600)),  # expiry
+    lambda t: "garbage",
+])
+def test_tampered_token_is_rejected(tamper):
+    issuer = TokenIssuer()
+    token, _ = issuer.issue("alice")
+    assert issuer.verify(tamper(token)) is None
+
+def test_token_from_another_server_is_rejected():
+    token, _ = TokenIssuer().issue("alice")
+    assert TokenIssuer().verify(token) is None
+
+def test_generated_key_is_owner_only(tmp_path):
+    umask = os.umask(0)
+    try:
+        key_path, cert_path = generate_certificates(str(tmp_path))
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(key_path).st_mode) == 0o600
+    assert generate_certificates(str(tmp_path)) == (key_path, cert_path)
+
+@pytest.fixture
+def server():
+    server, port = chat_server.create_server("127.0.0.1:0", invite_key=INVITE_KEY)
+    server.start()
+    channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+    yield server, chat_pb2_grpc.ChatServiceStub(channel)
+    channel.close()
+    server.stop(0)
+
+def bearer(token):
+    return [("authorization", f"Bearer {token}")]
+
+def login(stub, username, invite_key=INVITE_KEY):
+    return stub.Login(chat_pb2.LoginRequest(username=username, invite_key=invite_key)).token
+
+def wait_until(condition, timeout=5):
+    """Poll condition; server-side cleanup runs just after the client sees the call end"""
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+def open_chat(stub, token):
+    """Open a chat stream and wait for the roster snapshot; returns a function closing it"""
+    done = threading.Event()
+
+    def hello():
+        yield chat_pb2.ChatMessage(presence=chat_pb2.PresenceUpdate())
+        done.wait()
+
+    call = stub.Chat(hello(), metadata=bearer(token))
+    next(call)
+
+    def close():
+        done.set()
+        call.cancel()
+    return close
+
+def test_login_is_reachable_without_a_token(server):
+    _, stub = server
+    assert login(stub, "alice")
+
+def test_login_with_wrong_invite_key(server):
+    _, stub = server
+    with pytest.raises(grpc.RpcError) as error:
+        login(stub, "alice", invite_key="wrong")
+    assert error.value.code() == grpc.StatusCode.UNAUTHENTICATED
+
+@pytest.mark.parametrize("metadata", [None, bearer(""), bearer("not.a.token")])
+def test_calls_without_valid_token_are_rejected(server, metadata):
+    _, stub = server
+    with pytest.raises(grpc.RpcError) as error:
+        stub.Search(chat_pb2.SearchRequest(query="x"), metadata=metadata)
+    assert error.value.code() == grpc.StatusCode.UNAUTHENTICATED
+
+def test_valid_token_reaches_the_servicer(server):
+    _, stub = server
+    token = login(stub, "alice")
+    # This server has no history, so getting past the interceptor means UNIMPLEMENTED
+    with pytest.raises(grpc.RpcError) as error:
+        stub.Search(chat_pb2.SearchRequest(query="x"), metadata=bearer(token))
+    assert error.value.code() == grpc.StatusCode.UNIMPLEMENTED
+
+def test_relogin_revokes_older_token(server):
+    _, stub = server
+    old = login(stub, "alice")
+    login(stub, "alice")
+    with pytest.raises(grpc.RpcError) as error:
+        stub.Search(chat_pb2.SearchRequest(query="x"), metadata=bearer(old))
+    assert error.value.code() == grpc.StatusCode.UNAUTHENTICATED
+
+def test_connected_name_cannot_be_taken(server):
+    grpc_server, stub = server
+    close = open_chat(stub, login(stub, "alice"))
+    with pytest.raises(grpc.RpcError) as error:
+        login(stub, "alice")
+    assert error.value.code() == grpc.StatusCode.ALREADY_EXISTS
+
+    close()
+    sessions = next(iter(grpc_server._state.interceptor_pipeline.interceptors)).sessions
+    assert wait_until(lambda: not sessions.active)
+    assert login(stub, "alice")
+
+def test_session_cache_only_holds_open_calls(server):
+    grpc_server, stub = server
+    sessions = next(iter(grpc_server._state.interceptor_pipeline.interceptors)).sessions
+    token = login(stub, "alice")
+    for _ in range(5):
+        with pytest.raises(grpc.RpcError):
+            stub.Search(chat_pb2.SearchRequest(query="x"), metadata=bearer(token))
+    assert wait_until(lambda: not sessions.sessions)
+
+    close = open_chat(stub, token)
+    assert [s[0] for s in sessions.sessions.values()] == ["alice"]
+    close()
+    assert wait_until(lambda: not sessions.sessions and not sessions.active)
+
+@pytest.fixture
+def tls(tmp_path, monkeypatch):
+    """A TLS + auth server next to an insecure one; records logins and TLS session reuse per call"""
+    calls = {"logins": 0, "reused": []}
+    login = chat_server.ChatService.Login
+
+    def counting_login(self, request, context):
+        calls["logins"] += 1
+        return login(self, request, context)
+
+    def search(self, request, context):
+        calls["reused"].append(dict(context.auth_context()).get("ssl_session_reused") == [b"true"])
+        return chat_pb2.SearchResponse()
+
+    monkeypatch.setattr(chat_server.ChatService, "Login", counting_login)
+    monkeypatch.setattr(chat_server.ChatService, "Search", search)
+    secure, secure_port = chat_server.create_server(
+        "127.0.0.1:0", certs_dir=str(tmp_path), invite_key=INVITE_KEY
+    )
+    insecure, insecure_port = chat_server.create_server("127.0.0.1:0")
+    secure.start()
+    insecure.start()
+    with open(tmp_path / "server.crt", "rb") as f:
+        root_cert = f.read()
+    yield {"secure_port": secure_port, "insecure_port": insecure_port, "root_cert": root_cert, "calls": calls}
+    secure.stop(0)
+    insecure.stop(0)
+
+def tls_connect(tls, token=None, cache=None, root_cert=None):
+    """Open a fresh TLS channel, log in unless given a token, make one call; returns the token"""
+    credentials = grpc.ssl_channel_credentials(root_certificates=root_cert or tls["root_cert"])
+    options = [("grpc.ssl_session_cache", cache)] if cache else []
+    with grpc.secure_channel(f"localhost:{tls['secure_port']}", credentials, options=options) as channel:
+        stub = chat_pb2_grpc.ChatServiceStub(channel)
+        if token is None:
+            token = login(stub, "alice")
+        stub.Search(chat_pb2.SearchRequest(query="x"), metadata=bearer(token), timeout=5)
+    return token
+
+def insecure_connect(tls):
+    with grpc.insecure_channel(f"localhost:{tls['insecure_port']}") as channel:
+        chat_pb2_grpc.ChatServiceStub(channel).Search(chat_pb2.SearchRequest(query="x"), timeout=5)
+
+def median_latency(connect):
+    connect()  # Warm up imports, thread pools and the session cache
+    timings = []
+    for _ in range(LATENCY_ROUNDS):
+        start = time.perf_counter()
+        connect()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def within_bound(latency, insecure):
+    return latency <= insecure * TLS_LATENCY_FACTOR + TLS_LATENCY_SLACK
+
+def test_tls_requires_the_pinned_certificate(tls, tmp_path):
+    _, other_cert = generate_certificates(str(tmp_path / "other"))
+    with open(other_cert, "rb") as f:
+        wrong_root = f.read()
+    with pytest.raises(grpc.RpcError) as error:
+        tls_connect(tls, root_cert=wrong_root)
+    assert error.value.code() == grpc.StatusCode.UNAVAILABLE
+    assert tls["calls"]["logins"] == 0
+
+def test_tls_reconnect_reuses_token_and_session(tls):
+    cache = session_cache.ssl_session_cache_lru(8)
+    token = tls_connect(tls, cache=cache)
+    assert tls["calls"] == {"logins": 1, "reused": [False]}
+
+    tls_connect(tls, token, cache)
+    tls_connect(tls, token)  # Without the cache every connection is a full handshake
+    assert tls["calls"] == {"logins": 1, "reused": [False, True, False]}
+
+def test_tls_cold_connect_latency(tls):
+    insecure = median_latency(lambda: insecure_connect(tls))
+    cold = median_latency(lambda: tls_connect(tls))
+    assert within_bound(cold, insecure), f"TLS connect + login {cold * 1000:.2f}ms vs insecure {insecure * 1000:.2f}ms"
+
+def test_tls_reconnect_latency(tls):
+    cache = session_cache.ssl_session_cache_lru(8)
+    token = tls_connect(tls, cache=cache)
+    insecure = median_latency(lambda: insecure_connect(tls))
+    tls["calls"]["reused"].clear()
+    resumed = median_latency(lambda: tls_connect(tls, token, cache))
+    assert tls["calls"]["logins"] == 1 and all(tls["calls"]["reused"])
+    assert within_bound(resumed, insecure), f"TLS reconnect {resumed * 1000:.2f}ms vs insecure {insecure * 1000:.2f}ms"
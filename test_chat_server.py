@@ -0,0 +1,89 @@
+import queue
+
+import grpc
+import pytest
+
+import chat_pb2
+import chat_pb2_grpc
+import chat_server
+
+class Peer:
+    """One chat stream speaking raw bytes, so tests see exactly what the server relays"""
+
+    def __init__(self, channel, metadata=None):
+        self.outbox = queue.Queue()
+        chat = channel.stream_stream("/ChatService/Chat")
+        self.call = chat(iter(self.outbox.get, None), metadata=metadata, timeout=10)
+        self.send(chat_pb2.ChatMessage(presence=chat_pb2.PresenceUpdate()).SerializeToString())
+        assert chat_pb2.ChatMessage.FromString(next(self.call)).presence.snapshot
+
+    def send(self, data):
+        self.outbox.put(data)
+
+    def receive(self):
+        return next(self.call)
+
+    def close(self):
+        self.outbox.put(None)
+        self.call.cancel()
+
+@pytest.fixture
+def make_server():
+    started = []
+
+    def make(invite_key=None):
+        server, port = chat_server.create_server("127.0.0.1:0", invite_key=invite_key)
+        server.start()
+        channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+        started.append((server, channel))
+        return channel
+
+    yield make
+    for server, channel in started:
+        channel.close()
+        server.stop(0)
+
+def non_canonical_message():
+    """A valid ChatMessage whose fields are out of order; re-encoding it would sort them"""
+    return (
+        chat_pb2.ChatMessage(media_data=bytes(range(256)) * 64, media_type="image/png").SerializeToString()
+        + chat_pb2.ChatMessage(message="cat.png").SerializeToString()
+        + chat_pb2.ChatMessage(username="alice").SerializeToString()
+    )
+
+def test_relay_is_byte_for_byte(make_server):
+    channel = make_server()
+    alice, bob = Peer(channel), Peer(channel)
+    data = non_canonical_message()
+    assert chat_pb2.ChatMessage.FromString(data).SerializeToString() != data
+
+    alice.send(data)
+    assert bob.receive() == data
+    assert alice.receive() == data  # The sender gets its own message back too
+    alice.close()
+    bob.close()
+
+def test_authenticated_relay_rewrites_spoofed_username(make_server):
+    channel = make_server(invite_key="secret")
+    stub = chat_pb2_grpc.ChatServiceStub(channel)
+
+    def connect(username):
+        token = stub.Login(chat_pb2.LoginRequest(username=username, invite_key="secret")).token
+        return Peer(channel, metadata=[("authorization", f"Bearer {token}")])
+
+    alice, bob = connect("alice"), connect("bob")
+
+    # Already named correctly: relayed untouched
+    data = non_canonical_message()
+    alice.send(data)
+    assert bob.receive() == data
+
+    spoofed = chat_pb2.ChatMessage.FromString(data)
+    spoofed.username = "bob"
+    alice.send(spoofed.SerializeToString())
+    relayed = chat_pb2.ChatMessage.FromString(bob.receive())
+    assert relayed.username == "alice"
+    relayed.username = "bob"
+    assert relayed == spoofed
+    alice.close()
+    bob.close()
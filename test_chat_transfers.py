@@ -0,0 +1,128 @@
+import pytest
+
+import chat_transfers
+from chat_transfers import TransferManager
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(chat_transfers, "CHUNK_SIZE", 4)
+
+class Recorder:
+    def __init__(self):
+        self.progress = []
+        self.finished = []
+
+    def on_progress(self, transfer, sent, total):
+        self.progress.append((transfer.filename, sent, total))
+
+    def on_finished(self, transfer, error):
+        self.finished.append((transfer.filename, error))
+
+def prepare(filepath):
+    if filepath == "broken":
+        raise OSError("unreadable")
+    return filepath.encode() * 2, "application/x"
+
+def make_manager(recorder, prepare=prepare):
+    return TransferManager("me", prepare, recorder.on_progress, recorder.on_finished)
+
+def wait_ready(manager, count):
+    manager.executor.shutdown(wait=True)
+    assert len(manager.ready) == count
+
+def drain(manager):
+    """Send everything, confirming each message as the chat stream does once it is written"""
+    messages = []
+    while (msg := manager.next_message()) is not None:
+        manager.confirm(msg)
+        messages.append(msg)
+    return messages
+
+def test_round_robin_between_transfers():
+    recorder = Recorder()
+    manager = make_manager(recorder)
+    manager.add("aaaaaa", "a")  # 12 bytes -> 3 chunks
+    manager.add("bb", "b")      # 4 bytes -> 1 chunk
+    wait_ready(manager, 2)
+
+    order = [(m.message, m.chunk_index, m.chunk_count) for m in drain(manager)]
+    assert order == [("a", 0, 3), ("b", 0, 1), ("a", 1, 3), ("a", 2, 3)]
+    assert recorder.finished == [("b", None), ("a", None)]
+    assert recorder.progress[-1] == ("a", 12, 12)
+
+def test_cancel_mid_stream_sends_cancel_notice():
+    recorder = Recorder()
+    manager = make_manager(recorder)
+    transfer = manager.add("aaaaaa", "a")
+    wait_ready(manager, 1)
+
+    first = manager.next_message()
+    manager.confirm(first)
+    manager.cancel(transfer.id)
+    rest = drain(manager)
+    assert first.chunk_index == 0
+    assert [(m.transfer_id, m.cancelled) for m in rest] == [(first.transfer_id, True)]
+    assert recorder.finished == [("a", "cancelled")]
+
+def test_cancel_before_sending_is_silent():
+    recorder = Recorder()
+    manager = make_manager(recorder)
+    transfer = manager.add("aaaaaa", "a")
+    wait_ready(manager, 1)
+
+    manager.cancel(transfer.id)
+    assert drain(manager) == []
+    assert recorder.finished == [("a", "cancelled")]
+
+def test_failed_prepare_reports_error_and_sends_nothing():
+    recorder = Recorder()
+    manager = make_manager(recorder)
+    manager.add("broken", "x")
+    manager.add("ok", "y")
+    wait_ready(manager, 1)
+
+    assert [m.message for m in drain(manager)] == ["y"]
+    assert ("x", "unreadable") in recorder.finished
+
+def test_unconfirmed_last_chunk_does_not_finish():
+    recorder = Recorder()
+    manager = make_manager(recorder)
+    manager.add("bb", "b")
+    wait_ready(manager, 1)
+
+    last = manager.next_message()
+    assert recorder.finished == []
+    manager.confirm(last)
+    assert recorder.finished == [("b", None)]
+
+def test_cancel_after_last_chunk_lets_it_finish():
+    recorder = Recorder()
+    manager = make_manager(recorder)
+    transfer = manager.add("bb", "b")
+    wait_ready(manager, 1)
+
+    last = manager.next_message()
+    manager.cancel(transfer.id)
+    assert manager.next_message() is None  # No cancel notice
+    assert recorder.finished == []
+    manager.confirm(last)
+    assert recorder.finished == [("b", None)]
+
+def test_restart_resends_under_new_wire_id():
+    recorder = Recorder()
+    manager = make_manager(recorder)
+    manager.add("aaaaaa", "a")
+    wait_ready(manager, 1)
+
+    first = manager.next_message()
+    manager.confirm(first)
+    manager.next_message()  # Lost with the stream, never confirmed
+    manager.restart()
+    manager.confirm(first)  # A late confirmation for the old wire id is ignored
+
+    resent = drain(manager)
+    assert (resent[0].transfer_id, resent[0].cancelled) == (first.transfer_id, True)
+    assert [m.chunk_index for m in resent[1:]] == [0, 1, 2]
+    assert {m.transfer_id for m in resent[1:]} != {first.transfer_id}
+    assert ("a", 0, 12) in recorder.progress
+    assert recorder.finished == [("a", None)]